@@ -372,6 +372,8 @@ setting environment variables INVOKEAI_<setting>.
     precision           : Literal[tuple(['auto','float16','float32','autocast'])] = Field(default='float16',description='Floating point precision', category='Memory/Performance')
     sequential_guidance : bool = Field(default=False, description="Whether to calculate guidance in serial instead of in parallel, lowering memory requirements", category='Memory/Performance')
     xformers_enabled    : bool = Field(default=True, description="Enable/disable memory-efficient attention", category='Memory/Performance')
+    autoimport_parallelism : int = Field(default=1, gt=0, description="Number of threads used to scan the autoimport directories on startup. Values above 1 help on network filesystems", category='Memory/Performance')
+    codeformer_compile  : bool = Field(default=False, description="Compile the CodeFormer face restoration model with torch.compile on CUDA. The first restorations are slow while it compiles", category='Memory/Performance')
     tiled_decode        : bool = Field(default=False, description="Whether to enable tiled VAE decode (reduces memory consumption with some performance penalty)", category='Memory/Performance')
 
     root                : Path = Field(default=_find_root(), description='InvokeAI runtime root directory', category='Paths')
@@ -177,10 +177,12 @@ class ModelInstall(object):
     def heuristic_import(self,
                          model_path_id_or_url: Union[str,Path],
                          models_installed: Set[Path]=None,
+                         kind: str=None,
                          )->Dict[str, AddModelResult]:
         '''
         :param model_path_id_or_url: A Path to a local model to import, or a string representing its repo_id or URL
         :param models_installed: Set of installed models, used for recursive invocation
+        :param kind: For a folder the caller has already classified as a model ("diffusers", "lora" or "embedding"), skips re-probing it for marker files
         Returns a set of dict objects corresponding to newly-created stanzas in models.yaml.
         '''
 
@@ -196,10 +198,10 @@ class ModelInstall(object):
             models_installed.update({str(path):self._install_path(path)})
 
         # folders style or similar
-        elif path.is_dir() and any([(path/x).exists() for x in \
+        elif path.is_dir() and (kind is not None or any([(path/x).exists() for x in \
                                     {'config.json','model_index.json','learned_embeds.bin','pytorch_lora_weights.bin'}
                                     ]
-                                   ):
+                                   )):
             models_installed.update(self._install_path(path))
 
         # recursive scan
@@ -229,22 +229,32 @@ the root is the InvokeAI ROOTDIR.
 from __future__ import annotations
 
 import os
+import bisect
 import hashlib
+import io
+import json
+import pickle
 import textwrap
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, List, Tuple, Union, Dict, Set, Callable, types
 from shutil import rmtree, move
+from stat import S_ISLNK
 
 import torch
-from omegaconf import OmegaConf
-from omegaconf.dictconfig import DictConfig
+import yaml
 
 from pydantic import BaseModel, Field
 
 import invokeai.backend.util.logging as logger
 from invokeai.app.services.config import InvokeAIAppConfig
-from invokeai.backend.util import CUDA_DEVICE, Chdir
+from invokeai.backend.util import CUDA_DEVICE
 from .model_cache import ModelCache, ModelLocker
 from .models import (
     BaseModelType, ModelType, SubModelType,
@@ -252,6 +262,12 @@ from .models import (
     ModelConfigBase, ModelNotFoundException,
     )
 
+# prefer the libyaml C bindings when PyYAML was built with them
+try:
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
+
 # We are only starting to number the config file with release 3.
 # The config file version doesn't have to start at release version, but it will help
 # reduce confusion.
@@ -286,9 +302,163 @@ class AddModelResult(BaseModel):
 
 MAX_CACHE_SIZE = 6.0  # GB
 
+# upper bound on threads used to scan the models/<base>/<type> folders
+SCAN_MAX_WORKERS = 8
+
+# get_model() won't rescan the models directory for a model it failed
+# to find until this many seconds have passed since the last scan
+MISSING_MODEL_RESCAN_INTERVAL = 2.0
+
+# search_models() looks for stand-alone weight files with these suffixes,
+# skipping the weights that live inside diffusers folders
+SEARCH_MODEL_SUFFIXES = ('.ckpt', '.safetensors')
+SEARCH_EXCLUDED_FILES = frozenset({'model.safetensors', 'diffusion_pytorch_model.safetensors'})
+
+# autoimport() classifies a folder containing any of these files as a model
+# of that kind, and otherwise imports stand-alone files with these suffixes
+DIFFUSERS_MARKERS = frozenset({'config.json', 'model_index.json'})
+LORA_MARKERS = frozenset({'pytorch_lora_weights.bin'})
+EMBEDDING_MARKERS = frozenset({'learned_embeds.bin'})
+MODEL_FILE_SUFFIXES = ('.ckpt', '.bin', '.pth', '.safetensors', '.pt')
+
+# autoimport remembers what it found in each folder it walked here, under the root
+# directory, so that folders which haven't changed needn't be walked on every startup
+AUTOIMPORT_CACHE_FILE = '.autoimport_cache.json'
+AUTOIMPORT_CACHE_VERSION = 1
+# folders modified less than this long before being listed are always walked again
+AUTOIMPORT_MTIME_SLACK_NS = 2_000_000_000
+
 class ConfigMeta(BaseModel):
     version: str
 
+def _config_path(model_config: Union[ModelConfigBase, dict]) -> str:
+    """Return the path of a model config, whether or not it has been resolved yet."""
+    return model_config["path"] if isinstance(model_config, dict) else model_config.path
+
+def _is_under(path: Path, base: Path) -> bool:
+    """
+    Equivalent to path.is_relative_to(base), answering the common case with
+    a string prefix test before falling back to pathlib's parts comparison.
+    """
+    path_str, base_str = str(path), str(base)
+    if path_str.startswith(base_str) and path_str[len(base_str):len(base_str)+1] in ('', os.sep):
+        return True
+    try:
+        path.relative_to(base)
+        return True
+    except ValueError:
+        return False
+
+def _existing_names(directory: Path) -> Set[str]:
+    """
+    Return the names in directory that exist in the sense of Path.exists(),
+    i.e. leaving out dangling symlinks. Unreadable directories yield nothing.
+    """
+    try:
+        with os.scandir(directory) as entries:
+            return {x.name for x in entries if not x.is_symlink() or os.path.exists(x.path)}
+    except OSError:
+        return set()
+
+def _list_dir(directory: str) -> List[os.DirEntry]:
+    """
+    Return the entries of directory, or none if it can't be read, as os.walk() does.
+    """
+    try:
+        with os.scandir(directory) as entries:
+            return list(entries)
+    except OSError:
+        return []
+
+def _classify_dir(entries: List[os.DirEntry]) -> Optional[str]:
+    """
+    Return "diffusers", "lora" or "embedding" if the listed folder holds a
+    model of that kind, judging by its marker files, or None otherwise.
+    """
+    return _classify_names({x.name for x in entries})
+
+def _classify_names(names: Set[str]) -> Optional[str]:
+    """
+    Same as _classify_dir(), given the names in the folder.
+    """
+    if not names.isdisjoint(DIFFUSERS_MARKERS):
+        return "diffusers"
+    if not names.isdisjoint(LORA_MARKERS):
+        return "lora"
+    if not names.isdisjoint(EMBEDDING_MARKERS):
+        return "embedding"
+    return None
+
+class _PathPrefixes(object):
+    """
+    A set of directory paths that answers "is this path one of them or
+    inside one of them?" with a binary search over a sorted list of
+    non-nested prefixes.
+    """
+
+    def __init__(self, paths: Set[str]):
+        self.prefixes: List[str] = list()
+        for path in sorted(paths):
+            self.add(path)
+
+    def add(self, path: str):
+        prefix = path.rstrip(os.sep) + os.sep
+        if prefix in self:
+            return
+        index = bisect.bisect_left(self.prefixes, prefix)
+        # drop prefixes that the new one covers; they sort right after it
+        end = index
+        while end < len(self.prefixes) and self.prefixes[end].startswith(prefix):
+            end += 1
+        self.prefixes[index:end] = [prefix]
+
+    def __contains__(self, path: str) -> bool:
+        path = path.rstrip(os.sep) + os.sep
+        index = bisect.bisect_right(self.prefixes, path)
+        return index > 0 and path.startswith(self.prefixes[index-1])
+
+def _write_all(fd: int, data: bytes):
+    """os.write() may write less than it was given; loop until it's all out."""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+@lru_cache(maxsize=2048)
+def _create_key(
+    model_name: str,
+    base_model: BaseModelType,
+    model_type: ModelType,
+) -> str:
+    # plain strings are accepted too and hash the same as their enum members
+    base_str = _BASE_STR.get(base_model, base_model)
+    type_str = _TYPE_STR.get(model_type, model_type)
+    return f"{base_str}/{type_str}/{model_name}"
+
+# enum member -> string, looked up once instead of per-call .value access
+_BASE_STR = {x: x.value for x in BaseModelType}
+_TYPE_STR = {x: x.value for x in ModelType}
+
+# flattened views of MODEL_CLASSES, keyed by (base_model, model_type)
+_FLAT_CLASSES = {
+    (base, mtype): MODEL_CLASSES[base][mtype]
+    for base in BaseModelType for mtype in ModelType
+    if mtype in MODEL_CLASSES.get(base, {})
+}
+_SAVE_TO_CONFIG = {key: model_class.save_to_config for key, model_class in _FLAT_CLASSES.items()}
+_MODELS_SUBDIR = {(base, mtype): Path(_BASE_STR[base], _TYPE_STR[mtype]) for (base, mtype) in _FLAT_CLASSES}
+
+_MODEL_TYPE_VALUES = frozenset(_TYPE_STR.values())
+_BASE_MODEL_VALUES = frozenset(_BASE_STR.values())
+
+@lru_cache(maxsize=2048)
+def _parse_key(model_key: str) -> Tuple[str, BaseModelType, ModelType]:
+    base_model_str, model_type_str, model_name = model_key.split('/', 2)
+    if model_type_str not in _MODEL_TYPE_VALUES:
+        raise InvalidModelError(f"Unknown model type: {model_type_str}")
+    if base_model_str not in _BASE_MODEL_VALUES:
+        raise InvalidModelError(f"Unknown base model: {base_model_str}")
+    return (model_name, BaseModelType(base_model_str), ModelType(model_type_str))
+
 class ModelManager(object):
     """
     High-level interface to model management.
@@ -298,7 +468,7 @@ class ModelManager(object):
 
     def __init__(
         self,
-        config: Union[Path, DictConfig, str],
+        config: Union[Path, dict, str],
         device_type: torch.device = CUDA_DEVICE,
         precision: torch.dtype = torch.float16,
         max_cache_size=MAX_CACHE_SIZE,
@@ -315,22 +485,18 @@ class ModelManager(object):
         self.config_path = None
         if isinstance(config, (str, Path)):
             self.config_path = Path(config)
-            config = OmegaConf.load(self.config_path)
+            self._load_models_cached(self.config_path)
 
-        elif not isinstance(config, DictConfig):
-            raise ValueError('config argument must be an OmegaConf object, a Path or a string')
+        elif isinstance(config, dict):
+            self._parse_config(config)
 
-        self.config_meta = ConfigMeta(**config.pop("__metadata__"))
-        # TODO: metadata not found
-        # TODO: version check
+        else:
+            raise ValueError('config argument must be a dict, a Path or a string')
 
-        self.models = dict()
-        for model_key, model_config in config.items():
-            model_name, base_model, model_type = self.parse_key(model_key)
-            model_class = MODEL_CLASSES[base_model][model_type]
-            # alias for config file
-            model_config["model_format"] = model_config.pop("format")
-            self.models[model_key] = model_class.create_config(**model_config)
+        # model keys in list_models() order, kept up to date by _set_model()
+        # and _pop_model() so that listing doesn't have to sort every time
+        self._sorted_keys: List[str] = sorted(self.models, key=str.casefold)
+        self._folded_keys: List[str] = [x.casefold() for x in self._sorted_keys]
 
         # check config version number and update on disk/RAM if necessary
         self.app_config = InvokeAIAppConfig.get_config()
@@ -343,10 +509,101 @@ class ModelManager(object):
             logger = logger,
         )
         self.cache_keys = dict()
+        self._cache_path_memo: Dict[str, Path] = dict()
+        self._model_paths: Dict[str, Path] = dict()
+        self._model_cache_paths: Dict[str, Path] = dict()
+        # keys that get_model() recently failed to find on disk
+        self._missing_keys: Set[str] = set()
+        self._last_scan_monotonic: float = 0.0
+        # set by _batched_commits() to hold back commit() until the batch ends
+        self._defer_commit: bool = False
+        self._commit_pending: bool = False
 
         # add controlnet, lora and textual_inversion models from disk
         self.scan_models_directory()
 
+    def _parse_config(self, config: dict):
+        self.config_meta = ConfigMeta(**config.pop("__metadata__"))
+        # TODO: metadata not found
+        # TODO: version check
+
+        # configs are kept as raw stanzas here and only turned into
+        # ModelConfigBase objects by _resolve() when first needed
+        self.models = dict()
+        for model_key, model_config in config.items():
+            # alias for config file
+            model_config["model_format"] = model_config.pop("format")
+            self.models[model_key] = model_config
+
+    def _load_models_cached(self, config_path: Path):
+        """
+        Populate config_meta and models from the models.yaml file at
+        config_path, reusing the pickled result of an earlier parse when
+        the file has not changed since.
+        """
+        cache_key = self._models_cache_key(config_path)
+        try:
+            with open(self._models_cache_path(config_path), "rb") as file:
+                cached_key, models, config_meta = pickle.load(file)
+            if cached_key == cache_key:
+                self.models = models
+                self.config_meta = config_meta
+                return
+        except Exception:
+            pass # missing, unreadable or written by an incompatible release - reparse
+
+        with open(config_path, "rb") as file:
+            config = yaml.load(file, Loader=YamlLoader)
+        self._parse_config(config)
+        # keyed by the stat taken before the read: if the file changes in between,
+        # the key is already stale and the next load reparses
+        self._write_models_cache(config_path, self.models, cache_key)
+
+    def _resolve(self, model_key: str) -> ModelConfigBase:
+        """
+        Return the config object for model_key, building it from its raw
+        models.yaml stanza on first access.
+        """
+        model_config = self.models[model_key]
+        if isinstance(model_config, dict):
+            model_name, base_model, model_type = self.parse_key(model_key)
+            model_class = _FLAT_CLASSES[(base_model, model_type)]
+            # stanzas in a file of the current version were validated when they
+            # were written, so skip re-validating them; older files get the full check
+            if self.config_meta.version == CONFIG_FILE_VERSION:
+                model_config = model_class.construct_config(**model_config)
+            else:
+                model_config = model_class.create_config(**model_config)
+            self.models[model_key] = model_config
+        return model_config
+
+    def _models_cache_path(self, config_path: Path) -> Path:
+        return config_path.parent / ".cache" / f"{config_path.name}.pkl"
+
+    def _models_cache_key(self, config_path: Path, stat: os.stat_result=None) -> tuple:
+        stat = stat or config_path.stat()
+        return (str(config_path.absolute()), stat.st_mtime_ns, stat.st_size, CONFIG_FILE_VERSION)
+
+    def _write_models_cache(self, config_path: Path, models: Dict[str, Union[ModelConfigBase, dict]], cache_key: tuple):
+        """
+        Pickle the parsed contents of config_path next to it under cache_key,
+        the file's mtime and size when models was read from or written to it,
+        so that later edits invalidate the cache.
+        """
+        cache_path = self._models_cache_path(config_path)
+        tmpfile = cache_path.with_suffix(".tmp")
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmpfile, "wb") as file:
+                pickle.dump(
+                    (cache_key, models, self.config_meta),
+                    file,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmpfile, cache_path)
+        except OSError as e:
+            self.logger.warning(f"Could not write models cache {cache_path}: {e}")
+
     def model_exists(
         self,
         model_name: str,
@@ -360,32 +617,60 @@ class ModelManager(object):
         model_key = self.create_key(model_name, base_model, model_type)
         return model_key in self.models
 
-    @classmethod
-    def create_key(
-        cls,
-        model_name: str,
-        base_model: BaseModelType,
-        model_type: ModelType,
-    ) -> str:
-        return f"{base_model}/{model_type}/{model_name}"
+    # model keys are a small, bounded set, so both are memoized at module level
+    create_key = staticmethod(_create_key)
+    parse_key = staticmethod(_parse_key)
 
-    @classmethod
-    def parse_key(cls, model_key: str) -> Tuple[str, BaseModelType, ModelType]:
-        base_model_str, model_type_str, model_name = model_key.split('/', 2)
-        try:
-            model_type = ModelType(model_type_str)
-        except:
-            raise Exception(f"Unknown model type: {model_type_str}")
+    def _get_model_cache_path(self, model_path):
+        model_path = str(model_path)
+        cache_path = self._cache_path_memo.get(model_path)
+        if cache_path is None:
+            # existing conversions are stored under the MD5 name, so keep it
+            digest = hashlib.md5(model_path.encode()).hexdigest()
+            cache_path = self._cache_path_memo[model_path] = self.app_config.models_path / ".cache" / digest
+        return cache_path
+
+    def _model_path(self, model_key: str) -> Path:
+        """
+        Return the location of the model's files, joined onto the root
+        directory once and remembered until the model is removed or replaced.
+        """
+        model_path = self._model_paths.get(model_key)
+        if model_path is None:
+            model_path = self._model_paths[model_key] = self.app_config.root_path / _config_path(self.models[model_key])
+        return model_path
 
-        try:
-            base_model = BaseModelType(base_model_str)
-        except:
-            raise Exception(f"Unknown base model: {base_model_str}")
+    def _model_cache_path(self, model_key: str) -> Path:
+        """
+        Return the conversion cache location for the model's files.
+        """
+        cache_path = self._model_cache_paths.get(model_key)
+        if cache_path is None:
+            cache_path = self._model_cache_paths[model_key] = self._get_model_cache_path(self._model_path(model_key))
+        return cache_path
 
-        return (model_name, base_model, model_type)
+    def _set_model(self, model_key: str, model_config: Union[ModelConfigBase, dict]):
+        """
+        Add or replace model_key in the in-memory config.
+        """
+        if model_key not in self.models:
+            folded = model_key.casefold()
+            index = bisect.bisect_right(self._folded_keys, folded)
+            self._folded_keys.insert(index, folded)
+            self._sorted_keys.insert(index, model_key)
+        self.models[model_key] = model_config
 
-    def _get_model_cache_path(self, model_path):
-        return self.app_config.models_path / ".cache" / hashlib.md5(str(model_path).encode()).hexdigest()
+    def _pop_model(self, model_key: str) -> Optional[Union[ModelConfigBase, dict]]:
+        """
+        Remove model_key from the in-memory config along with its cached paths.
+        """
+        self._model_paths.pop(model_key, None)
+        self._model_cache_paths.pop(model_key, None)
+        if model_key in self.models:
+            index = self._sorted_keys.index(model_key, bisect.bisect_left(self._folded_keys, model_key.casefold()))
+            del self._sorted_keys[index]
+            del self._folded_keys[index]
+        return self.models.pop(model_key, None)
 
     def get_model(
         self,
@@ -402,40 +687,45 @@ class ModelManager(object):
         :param submode_typel: an ModelType enum indicating the portion of 
                the model to retrieve (e.g. ModelType.Vae)
         """
-        model_class = MODEL_CLASSES[base_model][model_type]
+        model_class = _FLAT_CLASSES[(base_model, model_type)]
         model_key = self.create_key(model_name, base_model, model_type)
 
-        # if model not found try to find it (maybe file just pasted)
+        # if model not found try to find it (maybe file just pasted), but don't
+        # rescan for a model that the last scan just failed to find
         if model_key not in self.models:
-            self.scan_models_directory(base_model=base_model, model_type=model_type)
+            if model_key not in self._missing_keys \
+               or time.monotonic() - self._last_scan_monotonic >= MISSING_MODEL_RESCAN_INTERVAL:
+                self.scan_models_directory(base_model=base_model, model_type=model_type)
             if model_key not in self.models:
+                self._missing_keys.add(model_key)
                 raise ModelNotFoundException(f"Model not found - {model_key}")
 
-        model_config = self.models[model_key]
-        model_path = self.app_config.root_path / model_config.path
+        model_config = self._resolve(model_key)
+        model_path = self._model_path(model_key)
 
         if not model_path.exists():
             if model_class.save_to_config:
-                self.models[model_key].error = ModelError.NotFound
+                model_config.error = ModelError.NotFound
                 raise Exception(f"Files for model \"{model_key}\" not found")
 
             else:
-                self.models.pop(model_key, None)
+                self._pop_model(model_key)
                 raise ModelNotFoundException(f"Model not found - {model_key}")
 
+        # TODO: path
+        # TODO: is it accurate to use path as id
+        dst_convert_path = self._model_cache_path(model_key)
+
         # vae/movq override
         # TODO: 
         if submodel_type is not None and hasattr(model_config, submodel_type):
             override_path = getattr(model_config, submodel_type)
             if override_path:
                 model_path = self.app_config.root_path / override_path
+                dst_convert_path = self._get_model_cache_path(model_path)
                 model_type = submodel_type
                 submodel_type = None
-                model_class = MODEL_CLASSES[base_model][model_type]
-
-        # TODO: path
-        # TODO: is it accurate to use path as id
-        dst_convert_path = self._get_model_cache_path(model_path)
+                model_class = _FLAT_CLASSES[(base_model, model_type)]
 
         model_path = model_class.convert_if_required(
             base_model=base_model,
@@ -476,11 +766,11 @@ class ModelManager(object):
         model_type: ModelType,
     ) -> dict:
         """
-        Given a model name returns the OmegaConf (dict-like) object describing it.
+        Given a model name returns a dict describing it.
         """
         model_key = self.create_key(model_name, base_model, model_type)
         if model_key in self.models:
-            return self.models[model_key].dict(exclude_defaults=True)
+            return self._resolve(model_key).dict(exclude_defaults=True)
         else:
             return None # TODO: None or empty dict on not found
 
@@ -514,17 +804,17 @@ class ModelManager(object):
         Return a list of models.
         """
 
-        model_keys = [self.create_key(model_name, base_model, model_type)] if model_name else sorted(self.models, key=str.casefold)
+        model_keys = [self.create_key(model_name, base_model, model_type)] if model_name else self._sorted_keys
         models = []
         for model_key in model_keys:
-            model_config = self.models[model_key]
-
+            # filter on the key before paying for resolving and serializing the config
             cur_model_name, cur_base_model, cur_model_type = self.parse_key(model_key)
             if base_model is not None and cur_base_model != base_model:
                 continue
             if model_type is not None and cur_model_type != model_type:
                 continue
 
+            model_config = self._resolve(model_key)
             model_dict = dict(
                 **model_config.dict(exclude_defaults=True),
                 # OpenAPIModelInfoBase
@@ -558,23 +848,23 @@ class ModelManager(object):
         Delete the named model.
         """
         model_key = self.create_key(model_name, base_model, model_type)
-        model_cfg = self.models.pop(model_key, None)
-
-        if model_cfg is None:
+        if model_key not in self.models:
             raise KeyError(f"Unknown model {model_key}")
 
+        model_path = self._model_path(model_key)
+        cache_path = self._model_cache_path(model_key)
+        self._pop_model(model_key)
+
         # note: it not garantie to release memory(model can has other references)
         cache_ids = self.cache_keys.pop(model_key, [])
         for cache_id in cache_ids:
             self.cache.uncache_model(cache_id)
 
         # if model inside invoke models folder - delete files
-        model_path = self.app_config.root_path / model_cfg.path
-        cache_path = self._get_model_cache_path(model_path)
         if cache_path.exists():
             rmtree(str(cache_path))
 
-        if model_path.is_relative_to(self.app_config.models_path):
+        if _is_under(model_path, self.app_config.models_path):
             if model_path.is_dir():
                 rmtree(str(model_path))
             else:
@@ -600,20 +890,19 @@ class ModelManager(object):
         model_info().
         """
 
-        model_class = MODEL_CLASSES[base_model][model_type]
+        model_class = _FLAT_CLASSES[(base_model, model_type)]
         model_config = model_class.create_config(**model_attributes)
         model_key = self.create_key(model_name, base_model, model_type)
 
         if  model_key in self.models and not clobber:
             raise Exception(f'Attempt to overwrite existing model definition "{model_key}"')
 
-        old_model = self.models.pop(model_key, None)
-        if old_model is not None:
+        if model_key in self.models:
             # TODO: if path changed and old_model.path inside models folder should we delete this too?
 
             # remove conversion cache as config changed
-            old_model_path = self.app_config.root_path / old_model.path
-            old_model_cache = self._get_model_cache_path(old_model_path)
+            old_model_cache = self._model_cache_path(model_key)
+            self._pop_model(model_key)
             if old_model_cache.exists():
                 if old_model_cache.is_dir():
                     rmtree(str(old_model_cache))
@@ -626,7 +915,8 @@ class ModelManager(object):
             for cache_id in cache_ids:
                 self.cache.uncache_model(cache_id)
 
-        self.models[model_key] = model_config
+        self._set_model(model_key, model_config)
+        self._missing_keys.clear()
         self.commit()
         return AddModelResult(
             name = model_name,
@@ -655,18 +945,21 @@ class ModelManager(object):
         if info["model_format"] != "checkpoint":
             raise ValueError(f"not a checkpoint format model: {model_name}")
 
-        # We are taking advantage of a side effect of get_model() that converts check points
-        # into cached diffusers directories stored at `location`. It doesn't matter
-        # what submodeltype we request here, so we get the smallest.
-        submodel = {"submodel_type": SubModelType.Tokenizer} if model_type==ModelType.Main else {}
-        model = self.get_model(model_name,
-                               base_model,
-                               model_type,
-                               **submodel,
-                               )
-        checkpoint_path = self.app_config.root_path / info["path"]
-        old_diffusers_path = self.app_config.models_path / model.location
-        new_diffusers_path = self.app_config.models_path / base_model.value / model_type.value / model_name
+        # Convert the checkpoint into the cached diffusers directory that get_model()
+        # would use, without going through the model cache to load it.
+        model_key = self.create_key(model_name, base_model, model_type)
+        checkpoint_path = self._model_path(model_key)
+        if not checkpoint_path.exists():
+            raise ModelNotFoundException(f"Files for model \"{model_key}\" not found")
+        model_class = _FLAT_CLASSES[(base_model, model_type)]
+        converted_path = model_class.convert_if_required(
+            base_model=base_model,
+            model_path=str(checkpoint_path),
+            output_path=self._model_cache_path(model_key),
+            config=self._resolve(model_key),
+        )
+        old_diffusers_path = self.app_config.models_path / converted_path
+        new_diffusers_path = self.app_config.models_path / _MODELS_SUBDIR[(base_model, model_type)] / model_name
         if new_diffusers_path.exists():
             raise ValueError(f"A diffusers model already exists at {new_diffusers_path}")
 
@@ -684,57 +977,105 @@ class ModelManager(object):
             rmtree(new_diffusers_path)
             raise
         
-        if checkpoint_path.exists() and checkpoint_path.is_relative_to(self.app_config.models_path):
+        if checkpoint_path.exists() and _is_under(checkpoint_path, self.app_config.models_path):
             checkpoint_path.unlink()
         
         return result
     
     def search_models(self, search_folder):
         self.logger.info(f"Finding Models In: {search_folder}")
-        models_folder_ckpt = Path(search_folder).glob("**/*.ckpt")
-        models_folder_safetensors = Path(search_folder).glob("**/*.safetensors")
-
-        ckpt_files = [x for x in models_folder_ckpt if x.is_file()]
-        safetensor_files = [x for x in models_folder_safetensors if x.is_file()]
-
-        files = ckpt_files + safetensor_files
 
         found_models = []
-        for file in files:
-            location = str(file.resolve()).replace("\\", "/")
-            if (
-                "model.safetensors" not in location
-                and "diffusion_pytorch_model.safetensors" not in location
-            ):
-                found_models.append({"name": file.stem, "location": location})
+        pending = [os.path.abspath(search_folder)]
+        while pending:
+            try:
+                with os.scandir(pending.pop()) as entries:
+                    for entry in entries:
+                        # like Path.glob('**'), don't descend into symlinked folders
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.name.endswith(SEARCH_MODEL_SUFFIXES) \
+                             and entry.name not in SEARCH_EXCLUDED_FILES \
+                             and entry.is_file():
+                            found_models.append({
+                                "name": os.path.splitext(entry.name)[0],
+                                "location": entry.path.replace("\\", "/"),
+                            })
+            except OSError:
+                continue # unreadable subdirectory
 
         return search_folder, found_models
 
+    @contextmanager
+    def _batched_commits(self):
+        """
+        Hold back the commit() calls made inside the block and write the
+        configuration once on the way out, if any were made. Nested blocks
+        leave the write to the outermost one.
+        """
+        if self._defer_commit:
+            yield
+            return
+        self._defer_commit = True
+        self._commit_pending = False
+        try:
+            yield
+        finally:
+            self._defer_commit = False
+            if self._commit_pending:
+                self._commit_pending = False
+                self.commit()
+
     def commit(self, conf_file: Path=None) -> None:
         """
         Write current configuration out to the indicated file.
         """
-        data_to_save = dict()
-        data_to_save["__metadata__"] = self.config_meta.dict()
+        if self._defer_commit and conf_file is None:
+            self._commit_pending = True
+            return
+
+        # emit one stanza at a time rather than building a dict of the whole file
+        yaml_out = io.StringIO()
+        yaml_out.write(self.preamble())
+        dump_kwargs = dict(stream=yaml_out, Dumper=YamlDumper, sort_keys=False, default_flow_style=False, allow_unicode=True)
+        yaml.dump({"__metadata__": self.config_meta.dict()}, **dump_kwargs)
+
+        saved_models = dict()
 
         for model_key, model_config in self.models.items():
             model_name, base_model, model_type = self.parse_key(model_key)
-            model_class = MODEL_CLASSES[base_model][model_type]
-            if model_class.save_to_config:
+            if not _SAVE_TO_CONFIG[(base_model, model_type)]:
+                continue
+
+            if isinstance(model_config, dict):
+                # never resolved, so it is still exactly what was read from disk
+                stanza = dict(model_config)
+                saved_models[model_key] = model_config
+            else:
                 # TODO: or exclude_unset better fits here?
-                data_to_save[model_key] = model_config.dict(exclude_defaults=True, exclude={"error"})
-                # alias for config file
-                data_to_save[model_key]["format"] = data_to_save[model_key].pop("model_format")
+                stanza = model_config.dict(exclude_defaults=True, exclude={"error"})
+                # errors are recomputed by scan_models_directory(), don't cache them
+                saved_models[model_key] = model_config.copy(update=dict(error=None)) if model_config.error else model_config
+            # alias for config file
+            stanza["format"] = stanza.pop("model_format")
+            yaml.dump({model_key: stanza}, **dump_kwargs)
 
-        yaml_str = OmegaConf.to_yaml(data_to_save)
         config_file_path = conf_file or self.config_path
         assert config_file_path is not None,'no config file path to write to'
         config_file_path = self.app_config.root_path / config_file_path
         tmpfile = os.path.join(os.path.dirname(config_file_path), "new_config.tmp")
-        with open(tmpfile, "w", encoding="utf-8") as outfile:
-            outfile.write(self.preamble())
-            outfile.write(yaml_str)
+        # write and fsync the new file before swapping it in, so that a crash
+        # can leave behind a stray tmpfile but never a truncated models.yaml
+        fd = os.open(tmpfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+        try:
+            _write_all(fd, yaml_out.getvalue().encode("utf-8"))
+            os.fsync(fd)
+            # the stat of what was written, not of whatever is at the path later
+            cache_key = self._models_cache_key(config_file_path, os.fstat(fd))
+        finally:
+            os.close(fd)
         os.replace(tmpfile, config_file_path)
+        self._write_models_cache(config_file_path, saved_models, cache_key)
 
     def preamble(self) -> str:
         """
@@ -762,53 +1103,105 @@ class ModelManager(object):
         new_models_found = False
 
         self.logger.info(f'scanning {self.app_config.models_path} for new models')
-        with Chdir(self.app_config.root_path):
-            for model_key, model_config in list(self.models.items()):
+        # check that known models are still on disk with one directory
+        # listing per folder instead of one stat() per model
+        by_parent = defaultdict(list)
+        for model_key in list(self.models):
+            model_path = self._model_path(model_key).absolute()
+            by_parent[model_path.parent].append((model_key, model_path))
+
+        for parent, known_models in by_parent.items():
+            present = _existing_names(parent) if len(known_models) > 1 else set()
+            for model_key, model_path in known_models:
+                # a name that isn't listed may still exist under a different case
+                if model_path.name in present or model_path.exists():
+                    loaded_files.add(str(model_path))
+                    continue
                 model_name, cur_base_model, cur_model_type = self.parse_key(model_key)
-                model_path = self.app_config.root_path.absolute() / model_config.path
-                if not model_path.exists():
-                    model_class = MODEL_CLASSES[cur_base_model][cur_model_type]
-                    if model_class.save_to_config:
-                        model_config.error = ModelError.NotFound
-                    else:
-                        self.models.pop(model_key, None)
+                if _SAVE_TO_CONFIG[(cur_base_model, cur_model_type)]:
+                    self._resolve(model_key).error = ModelError.NotFound
                 else:
-                    loaded_files.add(model_path)
+                    self._pop_model(model_key)
 
-            for cur_base_model in BaseModelType:
-                if base_model is not None and cur_base_model != base_model:
-                    continue
+        subdirs = list()
+        for (cur_base_model, cur_model_type), model_class in _FLAT_CLASSES.items():
+            if base_model is not None and cur_base_model != base_model:
+                continue
+            if model_type is not None and cur_model_type != model_type:
+                continue
+            models_dir = self.app_config.models_path / _MODELS_SUBDIR[(cur_base_model, cur_model_type)]
 
-                for cur_model_type in ModelType:
-                    if model_type is not None and cur_model_type != model_type:
-                        continue
-                    model_class = MODEL_CLASSES[cur_base_model][cur_model_type]
-                    models_dir = self.app_config.models_path / cur_base_model.value / cur_model_type.value
+            if not models_dir.exists():
+                continue # TODO: or create all folders?
+            subdirs.append((cur_base_model, cur_model_type, model_class, models_dir))
 
-                    if not models_dir.exists():
-                        continue # TODO: or create all folders?
+        # the folders are disjoint and scanning them is dominated by filesystem
+        # latency, so fan them out to threads and merge the results here
+        def scan(subdir):
+            return self._scan_models_subdir(*subdir, loaded_files=loaded_files)
 
-                    for model_path in models_dir.iterdir():
-                        if model_path not in loaded_files: # TODO: check
-                            model_name = model_path.name if model_path.is_dir() else model_path.stem
-                            model_key = self.create_key(model_name, cur_base_model, cur_model_type)
+        if len(subdirs) <= 2:
+            results = [scan(x) for x in subdirs]
+        else:
+            with ThreadPoolExecutor(max_workers=SCAN_MAX_WORKERS) as executor:
+                results = list(executor.map(scan, subdirs))
 
-                            if model_key in self.models:
-                                raise Exception(f"Model with key {model_key} added twice")
+        for found in results:
+            for model_key, model_config in found:
+                self._set_model(model_key, model_config)
+                new_models_found = True
 
-                            if model_path.is_relative_to(self.app_config.root_path):
-                                model_path = model_path.relative_to(self.app_config.root_path)
-                            try:
-                                model_config: ModelConfigBase = model_class.probe_config(str(model_path))
-                                self.models[model_key] = model_config
-                                new_models_found = True
-                            except NotImplementedError as e:
-                                self.logger.warning(e)
+        # models added by autoimport are written out together with the scan results
+        with self._batched_commits():
+            imported_models = self.autoimport()
+            self._last_scan_monotonic = time.monotonic()
 
-        imported_models = self.autoimport()
+            if new_models_found or imported_models:
+                self._missing_keys.clear()
+                if self.config_path:
+                    self.commit()
 
-        if (new_models_found or imported_models) and self.config_path:
-            self.commit()
+    def _scan_models_subdir(
+        self,
+        base_model: BaseModelType,
+        model_type: ModelType,
+        model_class: type,
+        models_dir: Path,
+        loaded_files: Set[str],
+    ) -> List[Tuple[str, ModelConfigBase]]:
+        """
+        Probe the entries of one models/<base>/<type> folder that are not
+        loaded yet and return (model_key, model_config) pairs for them.
+        Only reads shared state so that folders can be scanned in parallel.
+        """
+        root_path = self.app_config.root_path.absolute()
+        found = list()
+        found_keys = set()
+        with os.scandir(models_dir) as entries:
+            for entry in entries:
+                if entry.path in loaded_files: # TODO: check
+                    continue
+
+                model_name = entry.name if entry.is_dir() else os.path.splitext(entry.name)[0]
+                model_key = self.create_key(model_name, base_model, model_type)
+
+                if model_key in self.models or model_key in found_keys:
+                    raise Exception(f"Model with key {model_key} added twice")
+
+                # probe by absolute path, then record the path relative to the root
+                # directory when possible; this doesn't depend on the process cwd
+                try:
+                    model_config: ModelConfigBase = model_class.probe_config(entry.path)
+                except NotImplementedError as e:
+                    self.logger.warning(e)
+                    continue
+                try:
+                    model_config.path = str(Path(entry.path).relative_to(root_path))
+                except ValueError:
+                    pass # outside the root directory, keep it absolute
+                found.append((model_key, model_config))
+                found_keys.add(model_key)
+        return found
 
     def autoimport(self)->Dict[str, AddModelResult]:
         '''
@@ -823,52 +1216,231 @@ class ModelManager(object):
                                  prediction_type_helper = ask_user_for_prediction_type,
                                  )
         
-        scanned_dirs = set()
-        
         config = self.app_config
-        known_paths = {(self.app_config.root_path / x['path']) for x in self.list_models()}
-
-        for autodir in [config.autoimport_dir,
-                        config.lora_dir,
-                        config.embedding_dir,
-                        config.controlnet_dir]:
-            if autodir is None:
-                continue
+        # Plain normalized strings, compared as-is against the entry.path strings of
+        # the walk, which starts from a normalized top folder. Neither side follows
+        # symlinks; resolving just one of them would make linked models look new.
+        root = os.fspath(self.app_config.root_path)
+        # read the paths straight from the stanzas; list_models() would build and
+        # serialize every config at startup
+        known_paths = {os.path.normpath(os.path.join(root, _config_path(x))) for x in self.models.values()}
+        # nothing inside a known model folder is imported, so those subtrees are skipped
+        known_prefixes = _PathPrefixes(known_paths)
+        import_lock = threading.Lock()
+        workers = config.autoimport_parallelism
+        cache_path = self.app_config.root_path / AUTOIMPORT_CACHE_FILE
+        walk_cache = self._load_autoimport_cache(cache_path)
+        new_walk_cache = dict()
+        installed = dict()
+
+        # every model the installer adds would otherwise rewrite models.yaml
+        with self._batched_commits():
+            for autodir in [config.autoimport_dir,
+                            config.lora_dir,
+                            config.embedding_dir,
+                            config.controlnet_dir]:
+                if autodir is None:
+                    continue
 
-            self.logger.info(f'Scanning {autodir} for models to import')
-            installed = dict()
+                self.logger.info(f'Scanning {autodir} for models to import')
         
-            autodir = self.app_config.root_path / autodir
-            if not autodir.exists():
-                continue
+                autodir = self.app_config.root_path / autodir
+                if not autodir.exists():
+                    continue
 
-            items_scanned = 0
-            new_models_found = dict()
-            
-            for root, dirs, files in os.walk(autodir):
-                items_scanned += len(dirs) + len(files)
-                for d in dirs:
-                    path = Path(root) / d
-                    if path in known_paths or path.parent in scanned_dirs:
-                        scanned_dirs.add(path)
-                        continue
-                    if any([(path/x).exists() for x in {'config.json','model_index.json','learned_embeds.bin','pytorch_lora_weights.bin'}]):
-                        new_models_found.update(installer.heuristic_import(path))
-                        scanned_dirs.add(path)
-
-                for f in files:
-                    path = Path(root) / f
-                    if path in known_paths or path.parent in scanned_dirs:
-                        continue
-                    if path.suffix in {'.ckpt','.bin','.pth','.safetensors','.pt'}:
-                        import_result = installer.heuristic_import(path)
-                        new_models_found.update(import_result)
-
-            self.logger.info(f'Scanned {items_scanned} files and directories, imported {len(new_models_found)} models')
-            installed.update(new_models_found)
+                top = os.path.normpath(autodir)
+                items_scanned = 0
+                new_models_found = dict()
+
+                # What the walk saw: the mtime of every folder it listed, the models it
+                # tried to import and the known folders it skipped. If none of that has
+                # changed by the next startup, the walk is replayed from this instead.
+                dir_mtimes = dict()
+                candidates = list()
+                pruned = list()
+
+                def import_model(path: str, kind: str=None):
+                    with import_lock:
+                        candidates.append((path, kind))
+                        new_models_found.update(installer.heuristic_import(Path(path), kind=kind))
+                        if kind is not None:
+                            known_prefixes.add(path) # in case autodirs overlap
+
+                def is_known(path: str) -> bool:
+                    with import_lock:
+                        if path in known_prefixes:
+                            pruned.append(path)
+                            return True
+                    return False
+
+                def is_known_file(path: str) -> bool:
+                    if path in known_paths:
+                        with import_lock:
+                            pruned.append(path)
+                        return True
+                    return False
+
+                def stamp(path: str, st: os.stat_result=None):
+                    try:
+                        st = st or os.stat(path)
+                    except OSError:
+                        dir_mtimes[path] = None
+                        return
+                    # a change within the mtime granularity of the filesystem could go
+                    # unnoticed, so don't trust folders that were modified just now
+                    recent = time.time_ns() - st.st_mtime_ns < AUTOIMPORT_MTIME_SLACK_NS
+                    dir_mtimes[path] = None if recent else st.st_mtime_ns
+
+                def list_dir(path: str) -> List[os.DirEntry]:
+                    stamp(path)
+                    return _list_dir(path)
+
+                def scan_directory(directory: str, entries: Optional[List[os.DirEntry]]):
+                    # Lists one directory and imports what it finds. Returns the number of
+                    # entries seen and the subdirectories still to be walked, each paired
+                    # with its already-listed entries. The installer and the bookkeeping
+                    # are shared by all workers, so they are only touched under the lock.
+                    if entries is None:
+                        if is_known(directory):
+                            return 0, []
+                        entries = list_dir(directory)
+
+                    subdirs = list()
+                    for entry in entries:
+                        if entry.is_dir():
+                            if is_known(entry.path):
+                                continue
+                            child_entries = list_dir(entry.path)
+                            kind = _classify_dir(child_entries)
+                            if kind is not None:
+                                import_model(entry.path, kind)
+                            # like os.walk(), list symlinked folders but don't descend into them
+                            elif not entry.is_symlink():
+                                subdirs.append((entry.path, child_entries))
+
+                        elif entry.name.endswith(MODEL_FILE_SUFFIXES) \
+                             and not is_known_file(entry.path):
+                            import_model(entry.path)
+                    return len(entries), subdirs
+
+                cached = walk_cache.get(top)
+                if cached is not None and self._autoimport_unchanged(top, cached, known_prefixes):
+                    for path, kind in cached['candidates']:
+                        if path not in known_prefixes:
+                            import_model(path, kind)
+                    self.logger.info(f'No changes since the last scan, imported {len(new_models_found)} models')
+                    new_walk_cache[top] = cached
+                    installed.update(new_models_found)
+                    continue
 
+                if workers > 1:
+                    # Directory listings are I/O bound and release the GIL, so fanning them
+                    # out helps on network filesystems. Imports stay serialized by the lock.
+                    with ThreadPoolExecutor(max_workers=workers) as executor:
+                        pending = {executor.submit(scan_directory, top, None)}
+                        while pending:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                count, subdirs = future.result()
+                                items_scanned += count
+                                pending.update(executor.submit(scan_directory, *x) for x in subdirs)
+                elif hasattr(os, 'fwalk') and not os.path.islink(top):
+                    # fwalk() lists each folder relative to its parent's open descriptor
+                    # rather than re-resolving the full path at every level. A folder is
+                    # classified when it is visited instead of when its parent is.
+                    # It yields nothing for a symlinked top folder, which the scandir
+                    # walk below follows like os.walk() did.
+                    for root, dirs, files, rootfd in os.fwalk(top):
+                        stamp(root, os.fstat(rootfd))
+                        if root != top:
+                            kind = _classify_names(set(dirs).union(files))
+                            if kind is not None:
+                                dirs[:] = []
+                                import_model(root, kind)
+                                continue
+                        items_scanned += len(dirs) + len(files)
+
+                        subdirs = list()
+                        for name in dirs:
+                            path = os.path.join(root, name)
+                            if is_known(path):
+                                continue
+                            try:
+                                is_link = S_ISLNK(os.stat(name, dir_fd=rootfd, follow_symlinks=False).st_mode)
+                            except OSError:
+                                continue
+                            # fwalk() doesn't descend into symlinked folders, but they may still be models
+                            if is_link:
+                                kind = _classify_dir(list_dir(path))
+                                if kind is not None:
+                                    import_model(path, kind)
+                            else:
+                                subdirs.append(name)
+                        dirs[:] = subdirs
+
+                        # only join the names that could be models
+                        for name in files:
+                            if name.endswith(MODEL_FILE_SUFFIXES):
+                                path = os.path.join(root, name)
+                                if not is_known_file(path):
+                                    import_model(path)
+                else:
+                    # Depth-first walk. Each pending item is a directory and its entries if
+                    # they have already been listed.
+                    pending = [(top, None)]
+                    while pending:
+                        count, subdirs = scan_directory(*pending.pop())
+                        items_scanned += count
+                        pending.extend(subdirs)
+
+                self.logger.info(f'Scanned {items_scanned} files and directories, imported {len(new_models_found)} models')
+                new_walk_cache[top] = dict(dirs=dir_mtimes, candidates=candidates, pruned=pruned)
+                installed.update(new_models_found)
+
+        if new_walk_cache != walk_cache:
+            self._write_autoimport_cache(cache_path, new_walk_cache)
         return installed
 
+    def _load_autoimport_cache(self, cache_path: Path) -> dict:
+        try:
+            with open(cache_path, "r") as file:
+                walk_cache = json.load(file)
+            if isinstance(walk_cache, dict) and walk_cache.get('version') == AUTOIMPORT_CACHE_VERSION:
+                return walk_cache['autodirs']
+        except (OSError, ValueError, KeyError):
+            pass # missing, unreadable or from an older release - walk everything
+        return dict()
+
+    def _write_autoimport_cache(self, cache_path: Path, walk_cache: dict):
+        tmpfile = cache_path.with_suffix(".tmp")
+        try:
+            with open(tmpfile, "w") as file:
+                json.dump(dict(version=AUTOIMPORT_CACHE_VERSION, autodirs=walk_cache), file)
+            os.replace(tmpfile, cache_path)
+        except OSError as e:
+            self.logger.warning(f"Could not write autoimport cache {cache_path}: {e}")
+
+    def _autoimport_unchanged(self, top: str, cached: dict, known_prefixes: _PathPrefixes) -> bool:
+        """
+        Return True if walking the autoimport folder top again would find what
+        the walk recorded in cached did. Adding, removing or renaming anything
+        changes the mtime of the folder holding it, so it is enough that no
+        listed folder changed and that every known model the walk skipped is
+        still known. A record that doesn't include top itself never listed
+        anything and proves nothing.
+        """
+        try:
+            if top not in cached['dirs']:
+                return False
+            if any(x not in known_prefixes for x in cached['pruned']):
+                return False
+            for path, mtime_ns in cached['dirs'].items():
+                if mtime_ns is None or os.stat(path).st_mtime_ns != mtime_ns:
+                    return False
+        except (OSError, KeyError, TypeError, AttributeError):
+            return False
+        return True
+
     def heuristic_import(self,
                          items_to_import: Set[str],
                          prediction_type_helper: Callable[[Path],SchedulerPredictionType]=None,
@@ -900,8 +1472,9 @@ class ModelManager(object):
         installer = ModelInstall(config = self.app_config,
                                  prediction_type_helper = prediction_type_helper,
                                  model_manager = self)
-        for thing in items_to_import:
-            installed = installer.heuristic_import(thing)
-            successfully_installed.update(installed)
-        self.commit()                
+        with self._batched_commits():
+            for thing in items_to_import:
+                installed = installer.heuristic_import(thing)
+                successfully_installed.update(installed)
+            self.commit()
         return successfully_installed
@@ -163,6 +163,22 @@ class ModelBase(metaclass=ABCMeta):
         configs = cls._get_configs()
         return configs[kwargs["model_format"]](**kwargs)
 
+    @classmethod
+    def construct_config(cls, **kwargs) -> ModelConfigBase:
+        """
+        Like create_config(), but skips pydantic validation. Only meant for
+        config data that has been written by the current release. Data that
+        is missing required fields still goes through full validation.
+        """
+        if "model_format" not in kwargs:
+            raise Exception("Field 'model_format' not found in model config")
+
+        config_class = cls._get_configs()[kwargs["model_format"]]
+        if any(field.required and name not in kwargs for name, field in config_class.__fields__.items()):
+            return config_class(**kwargs)
+        # construct() keeps unknown keys, which validation would have dropped
+        return config_class.construct(**{k: v for k, v in kwargs.items() if k in config_class.__fields__})
+
     @classmethod
     def probe_config(cls, path: str, **kwargs) -> ModelConfigBase:
         return cls.create_config(
@@ -1,17 +1,120 @@
 import os
 import sys
 import warnings
+from contextlib import nullcontext
+from functools import lru_cache
 
+import cv2
 import numpy as np
 import torch
 
 import invokeai.backend.util.logging as logger
 from invokeai.app.services.config import InvokeAIAppConfig
+from invokeai.backend.util.devices import choose_precision
 
 pretrained_model_url = (
     "https://github.com/sczhou/CodeFormer/releases/download/v0.1.0/codeformer.pth"
 )
 
+# faces run through CodeFormer together; each one takes a 512x512 slot
+FACE_BATCH_SIZE = 4
+
+_cf_deps = None
+
+
+def _get_deps() -> dict:
+    """
+    Import the face restoration libraries on first use and return them by
+    name. They are slow to import and only needed once CodeFormer runs.
+    """
+    global _cf_deps
+    if _cf_deps is None:
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", category=DeprecationWarning)
+            warnings.filterwarnings("ignore", category=UserWarning)
+
+            from basicsr.utils import img2tensor, tensor2img
+            from basicsr.utils.download_util import load_file_from_url
+            from facexlib.utils.face_restoration_helper import FaceRestoreHelper
+            from PIL import Image
+            from torchvision.transforms.functional import normalize
+
+            from .codeformer_arch import CodeFormer
+
+        _cf_deps = dict(
+            img2tensor=img2tensor,
+            tensor2img=tensor2img,
+            load_file_from_url=load_file_from_url,
+            FaceRestoreHelper=FaceRestoreHelper,
+            Image=Image,
+            normalize=normalize,
+            CodeFormer=CodeFormer,
+        )
+    return _cf_deps
+
+
+@lru_cache(maxsize=None)
+def _add_to_sys_path(path: str) -> None:
+    """
+    Append path to sys.path once per process. Every further entry makes
+    each later import search one more directory.
+    """
+    if path not in sys.path:
+        sys.path.append(path)
+
+
+@lru_cache(maxsize=1)
+def _load_cf_state(checkpoint_path) -> dict:
+    """
+    Read the CodeFormer EMA weights into CPU memory. They are shared by the
+    models built for each device, so the checkpoint is read from disk once.
+    """
+    return torch.load(checkpoint_path, map_location="cpu")["params_ema"]
+
+
+@lru_cache(maxsize=2)
+def _load_codeformer(model_path, device, dtype=torch.float32, compile=False):
+    """
+    Build CodeFormer on device with the pretrained weights, cast to dtype
+    and optionally wrapped with torch.compile(). The model is kept for
+    reuse; one per device, so CPU and CUDA can coexist.
+    """
+    deps = _get_deps()
+    cf = deps["CodeFormer"](
+        dim_embd=512,
+        codebook_size=1024,
+        n_head=8,
+        n_layers=9,
+        connect_list=["32", "64", "128", "256"],
+    )
+
+    # note that this file should already be downloaded and cached at
+    # this point
+    checkpoint_path = deps["load_file_from_url"](
+        url=pretrained_model_url,
+        model_dir=os.path.abspath(os.path.dirname(model_path)),
+        progress=True,
+    )
+    cf.load_state_dict(_load_cf_state(checkpoint_path), strict=True)
+    cf.eval()
+    cf = cf.to(device=device, dtype=dtype)
+    if compile:
+        cf = torch.compile(cf, mode="reduce-overhead")
+    return cf
+
+
+def _compile_errors() -> tuple:
+    """
+    The exceptions torch.compile() raises when it can't compile a model.
+    Anything else, such as running out of memory, isn't a reason to stop
+    compiling.
+    """
+    try:
+        from torch._dynamo.exc import TorchDynamoException
+    except ImportError:
+        return ()
+    return (TorchDynamoException,)
+
 
 class CodeFormerRestoration:
     def __init__(
@@ -25,7 +128,24 @@ class CodeFormerRestoration:
 
         if not self.codeformer_model_exists:
             logger.error(f"NOT FOUND: CodeFormer model not found at {self.model_path}")
-        sys.path.append(os.path.abspath(codeformer_dir))
+        _add_to_sys_path(os.path.abspath(codeformer_dir))
+        self._compile = self.globals.codeformer_compile and hasattr(torch, "compile")
+        # the face detection and parsing networks, loaded once per device
+        self._face_helpers = dict()
+
+    def _restore_faces(self, cf, faces_t, fidelity):
+        try:
+            return cf(faces_t, w=fidelity, adain=True)[0]
+        except _compile_errors() as error:
+            # torch.compile() compiles on the first call, so this is where it fails
+            if not hasattr(cf, "_orig_mod"):
+                raise
+            logger.warning(f"Could not compile CodeFormer, running it uncompiled: {error}")
+            self._compile = False
+            # drop the compiled model, or it would stay on the GPU next to the
+            # uncompiled one that the next call loads
+            _load_codeformer.cache_clear()
+            return cf._orig_mod(faces_t, w=fidelity, adain=True)[0]
 
     def process(self, image, strength, device, seed=None, fidelity=0.75):
         if seed is not None:
@@ -34,87 +154,109 @@ class CodeFormerRestoration:
             warnings.filterwarnings("ignore", category=DeprecationWarning)
             warnings.filterwarnings("ignore", category=UserWarning)
 
-            from basicsr.utils import img2tensor, tensor2img
-            from basicsr.utils.download_util import load_file_from_url
-            from facexlib.utils.face_restoration_helper import FaceRestoreHelper
-            from PIL import Image
-            from torchvision.transforms.functional import normalize
+            deps = _get_deps()
+            img2tensor, tensor2img = deps["img2tensor"], deps["tensor2img"]
+            FaceRestoreHelper = deps["FaceRestoreHelper"]
+            Image = deps["Image"]
+            normalize = deps["normalize"]
 
-            from .codeformer_arch import CodeFormer
+            # CodeFormer is inference-only and holds up in half precision, which
+            # halves its memory traffic on CUDA. Other devices stay in float32.
+            device = torch.device(device)
+            precision = self.globals.precision
+            if precision == "auto":
+                precision = choose_precision(device)
+            dtype = torch.float16 if device.type == "cuda" and precision != "float32" else torch.float32
 
-            cf_class = CodeFormer
-
-            cf = cf_class(
-                dim_embd=512,
-                codebook_size=1024,
-                n_head=8,
-                n_layers=9,
-                connect_list=["32", "64", "128", "256"],
-            ).to(device)
-
-            # note that this file should already be downloaded and cached at
-            # this point
-            checkpoint_path = load_file_from_url(
-                url=pretrained_model_url,
-                model_dir=os.path.abspath(os.path.dirname(self.model_path)),
-                progress=True,
-            )
-            checkpoint = torch.load(checkpoint_path)["params_ema"]
-            cf.load_state_dict(checkpoint)
-            cf.eval()
+            # with free_gpu_mem the networks are loaded for this call only, rather
+            # than being kept on the GPU for the life of the process
+            keep_loaded = not (self.globals.free_gpu_mem and device.type == "cuda")
+            if keep_loaded:
+                cf = _load_codeformer(self.model_path, device, dtype, self._compile and device.type == "cuda")
+            else:
+                _load_codeformer.cache_clear()
+                self._face_helpers.clear()
+                cf = _load_codeformer.__wrapped__(self.model_path, device, dtype)
 
             image = image.convert("RGB")
             # Codeformer expects a BGR np array; make array and flip channels
-            bgr_image_array = np.array(image, dtype=np.uint8)[..., ::-1]
-
-            face_helper = FaceRestoreHelper(
-                upscale_factor=1,
-                use_parse=True,
-                device=device,
-                model_rootpath = self.globals.model_path / 'core/face_restoration/gfpgan/weights'
-            )
+            bgr_image_array = cv2.cvtColor(np.asarray(image, dtype=np.uint8), cv2.COLOR_RGB2BGR)
+
+            face_helper = self._face_helpers.get(device)
+            if face_helper is None:
+                face_helper = FaceRestoreHelper(
+                    upscale_factor=1,
+                    use_parse=True,
+                    device=device,
+                    model_rootpath = self.globals.model_path / 'core/face_restoration/gfpgan/weights'
+                )
+                if keep_loaded:
+                    self._face_helpers[device] = face_helper
             face_helper.clean_all()
             face_helper.read_image(bgr_image_array)
-            face_helper.get_face_landmarks_5(resize=640, eye_dist_threshold=5)
+            # the detector and the parsing network only run inference, so skip
+            # autograd bookkeeping for them as well
+            with torch.inference_mode():
+                face_helper.get_face_landmarks_5(resize=640, eye_dist_threshold=5)
             face_helper.align_warp_face()
 
-            for idx, cropped_face in enumerate(face_helper.cropped_faces):
-                cropped_face_t = img2tensor(
-                    cropped_face / 255.0, bgr2rgb=True, float32=True
-                )
-                normalize(
-                    cropped_face_t, (0.5, 0.5, 0.5), (0.5, 0.5, 0.5), inplace=True
-                )
-                cropped_face_t = cropped_face_t.unsqueeze(0).to(device)
+            # restore the faces a batch at a time, so that a crowd doesn't run out of memory
+            cropped_faces = face_helper.cropped_faces
+            pin = device.type == "cuda"
+            for start in range(0, len(cropped_faces), FACE_BATCH_SIZE):
+                batch = cropped_faces[start:start + FACE_BATCH_SIZE]
+                faces = [
+                    normalize(
+                        img2tensor(cropped_face / 255.0, bgr2rgb=True, float32=True),
+                        (0.5, 0.5, 0.5), (0.5, 0.5, 0.5), inplace=True
+                    )
+                    for cropped_face in batch
+                ]
+                # stack into page-locked memory so the upload can be asynchronous
+                faces_t = torch.empty((len(faces), *faces[0].shape), pin_memory=pin)
+                torch.stack(faces, out=faces_t)
+                faces_t = faces_t.to(device, non_blocking=pin).to(dtype)
+
+                # autocast() refuses devices other than cuda and cpu even when disabled
+                if dtype == torch.float16:
+                    autocast = torch.autocast(device_type=device.type, dtype=torch.float16)
+                else:
+                    autocast = nullcontext()
 
                 try:
-                    with torch.no_grad():
-                        output = cf(cropped_face_t, w=fidelity, adain=True)[0]
-                        restored_face = tensor2img(
-                            output.squeeze(0), rgb2bgr=True, min_max=(-1, 1)
-                        )
+                    with torch.inference_mode(), autocast:
+                        output = self._restore_faces(cf, faces_t, fidelity)
+                        restored_faces = [
+                            tensor2img(x, rgb2bgr=True, min_max=(-1, 1)) for x in output
+                        ]
                     del output
-                    torch.cuda.empty_cache()
                 except RuntimeError as error:
                     logger.error(f"Failed inference for CodeFormer: {error}.")
-                    restored_face = cropped_face
+                    restored_faces = batch
+                del faces_t
 
-                restored_face = restored_face.astype("uint8")
-                face_helper.add_restored_face(restored_face)
+                for restored_face in restored_faces:
+                    face_helper.add_restored_face(restored_face.astype("uint8"))
 
             face_helper.get_inverse_affine(None)
 
-            restored_img = face_helper.paste_faces_to_input_image()
+            with torch.inference_mode():
+                restored_img = face_helper.paste_faces_to_input_image()
 
-            # Flip the channels back to RGB
-            res = Image.fromarray(restored_img[..., ::-1])
+            # return the allocator's cached blocks once per image, not once per face
+            if not keep_loaded:
+                del cf, face_helper
+                torch.cuda.empty_cache()
 
             if strength < 1.0:
                 # Resize the image to the new image if the sizes have changed
-                if restored_img.size != image.size:
-                    image = image.resize(res.size)
-                res = Image.blend(image, res, strength)
+                if restored_img.shape != bgr_image_array.shape:
+                    bgr_image_array = cv2.resize(
+                        bgr_image_array, restored_img.shape[1::-1], interpolation=cv2.INTER_CUBIC
+                    )
+                restored_img = cv2.addWeighted(restored_img, strength, bgr_image_array, 1.0 - strength, 0)
 
-            cf = None
+            # Flip the channels back to RGB
+            res = Image.fromarray(cv2.cvtColor(restored_img, cv2.COLOR_BGR2RGB))
 
             return res
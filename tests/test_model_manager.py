@@ -0,0 +1,334 @@
+import os
+import pytest
+import time
+import yaml
+
+from pathlib import Path
+
+os.environ['INVOKEAI_ROOT']='/tmp'
+
+import torch
+
+import invokeai.backend.install.model_install_backend as model_install_backend
+from invokeai.app.services.config import InvokeAIAppConfig
+from invokeai.backend.model_management import ModelManager, BaseModelType, ModelType
+from invokeai.backend.model_management.model_manager import _PathPrefixes
+
+@pytest.fixture
+def imported(monkeypatch):
+    '''
+    Replace the installer used by autoimport with one that only records
+    what it was asked to import.
+    '''
+    calls = list()
+
+    class RecordingInstall(object):
+        def __init__(self, config, model_manager=None, prediction_type_helper=None):
+            pass
+
+        def heuristic_import(self, path, kind=None):
+            calls.append((str(path), kind))
+            return dict()
+
+    monkeypatch.setattr(model_install_backend, 'ModelInstall', RecordingInstall)
+    return calls
+
+@pytest.fixture
+def root(tmp_path, monkeypatch, imported):
+    # a configuration singleton of our own, rooted in the temporary directory
+    monkeypatch.setattr(InvokeAIAppConfig, 'singleton_config', None)
+    monkeypatch.setattr(InvokeAIAppConfig, 'singleton_init', None)
+    conf = InvokeAIAppConfig.get_config(root=str(tmp_path))
+    conf.parse_args(argv=[])
+    return tmp_path
+
+def touch(path: Path) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    return path
+
+def checkpoint(path: str, **kwargs) -> dict:
+    return dict(
+        path=path,
+        format='checkpoint',
+        config='configs/stable-diffusion/v1-inference.yaml',
+        variant='normal',
+        **kwargs,
+    )
+
+def write_models(root: Path, models: dict) -> Path:
+    conf_path = root / 'configs' / 'models.yaml'
+    conf_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(conf_path, 'w') as file:
+        yaml.safe_dump({'__metadata__': {'version': '3.0.0'}, **models}, file, sort_keys=False)
+    return conf_path
+
+def make_manager(conf_path: Path) -> ModelManager:
+    return ModelManager(conf_path, device_type=torch.device('cpu'), precision=torch.float32)
+
+def test_models_cache(root, monkeypatch):
+    touch(root / 'weights' / 'model1.safetensors')
+    conf_path = write_models(root, {'sd-1/main/model1': checkpoint('weights/model1.safetensors')})
+    make_manager(conf_path)
+    assert (root / 'configs' / '.cache' / 'models.yaml.pkl').exists()
+
+    # unchanged file: the pickle is used and models.yaml isn't parsed again
+    def reparse(self, config):
+        raise AssertionError('models.yaml was parsed again')
+
+    with monkeypatch.context() as m:
+        m.setattr(ModelManager, '_parse_config', reparse)
+        mgr = make_manager(conf_path)
+    model = mgr.list_model('model1', BaseModelType.StableDiffusion1, ModelType.Main)
+    assert model['path'] == 'weights/model1.safetensors'
+    assert 'description' not in model
+
+    # an edit changes the size and mtime of models.yaml, so the pickle is stale
+    write_models(root, {'sd-1/main/model1': checkpoint('weights/model1.safetensors', description='edited')})
+    mgr = make_manager(conf_path)
+    model = mgr.list_model('model1', BaseModelType.StableDiffusion1, ModelType.Main)
+    assert model['description'] == 'edited'
+
+def test_models_cache_unreadable(root):
+    touch(root / 'weights' / 'model1.safetensors')
+    conf_path = write_models(root, {'sd-1/main/model1': checkpoint('weights/model1.safetensors')})
+    make_manager(conf_path)
+
+    cache_path = root / 'configs' / '.cache' / 'models.yaml.pkl'
+    cache_path.write_bytes(b'not a pickle')
+    mgr = make_manager(conf_path)
+    assert mgr.model_exists('model1', BaseModelType.StableDiffusion1, ModelType.Main)
+
+def test_models_cache_after_commit(root, monkeypatch):
+    touch(root / 'weights' / 'model1.safetensors')
+    touch(root / 'weights' / 'model2.safetensors')
+    conf_path = write_models(root, {'sd-1/main/model1': checkpoint('weights/model1.safetensors')})
+    mgr = make_manager(conf_path)
+    mgr.add_model(
+        'model2', BaseModelType.StableDiffusion1, ModelType.Main,
+        dict(path='weights/model2.safetensors', model_format='checkpoint',
+             config='configs/stable-diffusion/v1-inference.yaml', variant='normal'),
+    )
+
+    # the cache written by commit() matches the file it wrote
+    def reparse(self, config):
+        raise AssertionError('models.yaml was parsed again')
+
+    with monkeypatch.context() as m:
+        m.setattr(ModelManager, '_parse_config', reparse)
+        mgr = make_manager(conf_path)
+    assert mgr.model_exists('model2', BaseModelType.StableDiffusion1, ModelType.Main)
+    with open(conf_path) as file:
+        assert 'sd-1/main/model2' in yaml.safe_load(file)
+
+def test_unknown_keys_dropped(root):
+    # stanzas of the current version skip validation, but not its cleanup
+    touch(root / 'weights' / 'model1.safetensors')
+    conf_path = write_models(root, {
+        'sd-1/main/model1': checkpoint('weights/model1.safetensors', stray='value'),
+    })
+    mgr = make_manager(conf_path)
+    model = mgr.list_model('model1', BaseModelType.StableDiffusion1, ModelType.Main)
+    assert model['path'] == 'weights/model1.safetensors'
+    assert 'stray' not in model
+
+def test_sorted_keys(root):
+    names = ('beta', 'Alpha', 'gamma')
+    for name in names + ('Delta', 'epsilon'):
+        touch(root / 'weights' / f'{name}.safetensors')
+    conf_path = write_models(root, {
+        f'sd-1/main/{name}': checkpoint(f'weights/{name}.safetensors') for name in names
+    })
+    mgr = make_manager(conf_path)
+
+    def listed():
+        # the index has to agree with sorting the keys from scratch
+        assert mgr._sorted_keys == sorted(mgr.models, key=str.casefold)
+        assert mgr._folded_keys == [x.casefold() for x in mgr._sorted_keys]
+        return [x['name'] for x in mgr.list_models()]
+
+    assert listed() == ['Alpha', 'beta', 'gamma']
+
+    for name in ('Delta', 'epsilon'):
+        mgr.add_model(
+            name, BaseModelType.StableDiffusion1, ModelType.Main,
+            dict(path=f'weights/{name}.safetensors', model_format='checkpoint',
+                 config='configs/stable-diffusion/v1-inference.yaml', variant='normal'),
+        )
+    assert listed() == ['Alpha', 'beta', 'Delta', 'epsilon', 'gamma']
+
+    # replacing a model doesn't add a second index entry
+    mgr.add_model(
+        'beta', BaseModelType.StableDiffusion1, ModelType.Main,
+        dict(path='weights/beta.safetensors', model_format='checkpoint',
+             config='configs/stable-diffusion/v1-inference.yaml', variant='normal',
+             description='replaced'),
+        clobber=True,
+    )
+    assert listed() == ['Alpha', 'beta', 'Delta', 'epsilon', 'gamma']
+
+    mgr.del_model('Delta', BaseModelType.StableDiffusion1, ModelType.Main)
+    mgr.del_model('Alpha', BaseModelType.StableDiffusion1, ModelType.Main)
+    assert listed() == ['beta', 'epsilon', 'gamma']
+    with pytest.raises(KeyError):
+        mgr.del_model('Delta', BaseModelType.StableDiffusion1, ModelType.Main)
+    assert listed() == ['beta', 'epsilon', 'gamma']
+
+    # del_model() doesn't write models.yaml itself; a fresh manager reading
+    # the committed file lists the same
+    mgr.commit()
+    mgr = make_manager(conf_path)
+    assert listed() == ['beta', 'epsilon', 'gamma']
+
+def test_sorted_keys_case(root):
+    # keys that differ only in case stay next to each other
+    for name in ('sd', 'SD', 'Sd'):
+        touch(root / 'weights' / f'{name}.safetensors')
+    conf_path = write_models(root, {
+        f'sd-1/main/{name}': checkpoint(f'weights/{name}.safetensors') for name in ('sd', 'SD')
+    })
+    mgr = make_manager(conf_path)
+    mgr.add_model(
+        'Sd', BaseModelType.StableDiffusion1, ModelType.Main,
+        dict(path='weights/Sd.safetensors', model_format='checkpoint',
+             config='configs/stable-diffusion/v1-inference.yaml', variant='normal'),
+    )
+    mgr.del_model('SD', BaseModelType.StableDiffusion1, ModelType.Main)
+    assert sorted(mgr._sorted_keys) == ['sd-1/main/Sd', 'sd-1/main/sd']
+    assert mgr._folded_keys == ['sd-1/main/sd', 'sd-1/main/sd']
+
+def abspath(*parts) -> str:
+    return os.path.join(os.sep, *parts)
+
+def test_path_prefixes():
+    prefixes = _PathPrefixes({abspath('models', 'a'), abspath('models', 'a', 'b'), abspath('models', 'c')})
+    # nested prefixes are covered by their parent
+    assert prefixes.prefixes == [abspath('models', 'a') + os.sep, abspath('models', 'c') + os.sep]
+
+    assert abspath('models', 'a') in prefixes
+    assert abspath('models', 'a') + os.sep in prefixes
+    assert abspath('models', 'a', 'b', 'model.ckpt') in prefixes
+    assert abspath('models', 'c', 'd') in prefixes
+    # a sibling that merely starts with the same characters isn't inside
+    assert abspath('models', 'ab') not in prefixes
+    assert abspath('models', 'b') not in prefixes
+    assert abspath('models') not in prefixes
+
+def test_path_prefixes_add():
+    prefixes = _PathPrefixes(set())
+    assert abspath('models') not in prefixes
+
+    prefixes.add(abspath('models', 'b'))
+    prefixes.add(abspath('models', 'a', 'x'))
+    prefixes.add(abspath('models', 'b', 'y'))  # already covered
+    assert prefixes.prefixes == [abspath('models', 'a', 'x') + os.sep, abspath('models', 'b') + os.sep]
+
+    # a parent replaces the prefixes below it, and only those
+    prefixes.add(abspath('models', 'a'))
+    assert prefixes.prefixes == [abspath('models', 'a') + os.sep, abspath('models', 'b') + os.sep]
+    prefixes.add(abspath('models'))
+    assert prefixes.prefixes == [abspath('models') + os.sep]
+    assert abspath('models', 'ab') in prefixes
+    assert abspath('modelsx') not in prefixes
+
+def age(top: Path):
+    # folders modified within the last moments are never trusted by the
+    # autoimport cache, so backdate the ones the tests have just made
+    then = time.time_ns() - 3600 * 10**9
+    for dirpath, dirnames, filenames in os.walk(top):
+        os.utime(dirpath, ns=(then, then))
+
+@pytest.fixture
+def replayed(monkeypatch):
+    '''
+    Record, for each autoimport folder, whether its cached walk was replayed.
+    '''
+    results = list()
+    unchanged = ModelManager._autoimport_unchanged
+
+    def recording_unchanged(self, top, cached, known_prefixes):
+        result = unchanged(self, top, cached, known_prefixes)
+        results.append(result)
+        return result
+
+    monkeypatch.setattr(ModelManager, '_autoimport_unchanged', recording_unchanged)
+    return results
+
+def autoimport_run(root: Path, imported: list, models: dict, fresh: bool=False) -> set:
+    if fresh:
+        (root / '.autoimport_cache.json').unlink()
+    del imported[:]
+    make_manager(write_models(root, models))
+    return set(imported)
+
+def test_autoimport_cache(root, imported, replayed):
+    main = root / 'autoimport' / 'main'
+    lora = root / 'autoimport' / 'lora'
+    touch(main / 'a.safetensors')
+    touch(main / 'notes.txt')
+    touch(main / 'known.safetensors')
+    touch(main / 'sub' / 'b.ckpt')
+    touch(main / 'sub' / 'pipeline' / 'model_index.json')
+    touch(lora / 'style' / 'pytorch_lora_weights.bin')
+    age(root / 'autoimport')
+    known = {'sd-1/main/known': checkpoint('autoimport/main/known.safetensors')}
+
+    found = autoimport_run(root, imported, known)
+    assert found == {
+        (str(main / 'a.safetensors'), None),
+        (str(main / 'sub' / 'b.ckpt'), None),
+        (str(main / 'sub' / 'pipeline'), 'diffusers'),
+        (str(lora / 'style'), 'lora'),
+    }
+    assert (root / '.autoimport_cache.json').exists()
+
+    # nothing changed: both folders are replayed from the cache
+    del replayed[:]
+    assert autoimport_run(root, imported, known) == found
+    assert replayed == [True, True]
+
+    # a known model removed from models.yaml has to be imported again
+    del replayed[:]
+    found = autoimport_run(root, imported, {})
+    assert replayed == [False, True]
+    assert (str(main / 'known.safetensors'), None) in found
+    assert found == autoimport_run(root, imported, {}, fresh=True)
+
+    # a new file changes the mtime of its folder
+    touch(main / 'sub' / 'c.pt')
+    del replayed[:]
+    found = autoimport_run(root, imported, {})
+    assert replayed == [False, True]
+    assert (str(main / 'sub' / 'c.pt'), None) in found
+    assert found == autoimport_run(root, imported, {}, fresh=True)
+
+def test_autoimport_cache_invalid(root, imported, replayed):
+    main = root / 'autoimport' / 'main'
+    touch(main / 'a.safetensors')
+    age(root / 'autoimport')
+    found = autoimport_run(root, imported, {})
+
+    # a cache from another release or a damaged one means walking everything again
+    for content in ('{"version": 0, "autodirs": {}}', 'not json'):
+        (root / '.autoimport_cache.json').write_text(content)
+        del replayed[:]
+        assert autoimport_run(root, imported, {}) == found
+        assert replayed == []
+
+def test_autoimport_symlinked_dir(root, imported, replayed):
+    # the autoimport folder itself may be a link to wherever the models are kept
+    touch(root / 'elsewhere' / 'a.safetensors')
+    touch(root / 'elsewhere' / 'sub' / 'b.ckpt')
+    (root / 'autoimport').mkdir()
+    os.symlink(root / 'elsewhere', root / 'autoimport' / 'main', target_is_directory=True)
+    age(root / 'elsewhere')
+
+    # models are imported by their path through the link
+    main = root / 'autoimport' / 'main'
+    expected = {
+        (str(main / 'a.safetensors'), None),
+        (str(main / 'sub' / 'b.ckpt'), None),
+    }
+    assert autoimport_run(root, imported, {}) == expected
+    assert autoimport_run(root, imported, {}) == expected
+    assert replayed == [True]